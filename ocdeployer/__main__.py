@@ -9,20 +9,26 @@ import sys
 import threading
 
 import click
-import prompter
 import yaml
 
-from ocdeployer.deploy import DeployRunner
-from ocdeployer.env import EnvConfigHandler, LegacyEnvConfigHandler
-from ocdeployer.events import start_event_watcher
-from ocdeployer.secrets import SecretImporter
-from ocdeployer.utils import all_sets, get_dir, get_routes, get_server_info, oc, switch_to_project
+from ocdeployer.utils import (
+    SafeDumper,
+    all_sets,
+    get_dir,
+    get_routes,
+    get_server_info,
+    oc,
+    switch_to_project,
+)
 
 log = logging.getLogger("ocdeployer")
 CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
+LABEL_REGEX = re.compile(r"\A\w+=\w+\Z")
 
 
 def wipe(no_confirm, project, label):
+    import prompter
+
     server = get_server_info()
     extra_msg = ""
     if label:
@@ -43,30 +49,28 @@ def wipe(no_confirm, project, label):
     else:
         args = ["--all"]
 
-    oc("delete", "all", *args, _exit_on_err=False)
-    oc("delete", "configmap", *args, _exit_on_err=False)
-    oc("delete", "secret", *args, _exit_on_err=False)
-    oc("delete", "pvc", *args, _exit_on_err=False)
+    oc("delete", "all,configmap,secret,pvc", *args, _exit_on_err=False)
+
+
+def _dump_output(data, output):
+    """Write 'data' to stdout in the requested 'json' or 'yaml' format."""
+    if output == "json":
+        json.dump(data, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    elif output == "yaml":
+        print(yaml.dump(data, Dumper=SafeDumper, default_flow_style=False))
 
 
 def list_routes(project, output=None):
-    switch_to_project(project)
-    route_data = get_routes()
+    route_data = get_routes(namespace=project)
 
     if not output:
-        log.info("The following routes now exist:")
-        max_len = 10
-        for svc_name in route_data:
-            if len(svc_name) > max_len:
-                max_len = len(svc_name)
-        for svc_name, svc_route in route_data.items():
-            log.info("%-*s %s", max_len, svc_name, svc_route)
-
-    elif output == "json":
-        print(json.dumps(route_data, indent=2))
+        max_len = max(10, max(map(len, route_data), default=0))
+        lines = [f"{svc_name:<{max_len}} {svc_route}" for svc_name, svc_route in route_data.items()]
+        log.info("The following routes now exist:\n%s", "\n".join(lines))
 
-    elif output == "yaml":
-        print(yaml.dump(route_data, default_flow_style=False))
+    else:
+        _dump_output(route_data, output)
 
 
 def list_sets(template_dir, output=None):
@@ -75,17 +79,12 @@ def list_sets(template_dir, output=None):
     if not output:
         log.info("Available service sets:\n * %s", "\n * ".join(as_dict["service_sets"]))
 
-    elif output == "json":
-        print(json.dumps(as_dict, indent=2))
-
-    elif output == "yaml":
-        print(yaml.dump(as_dict, default_flow_style=False))
+    else:
+        _dump_output(as_dict, output)
 
 
 def verify_label(label):
-    if not label:
-        return
-    if not re.match(r"^\w+=\w+$", label):
+    if label and not LABEL_REGEX.match(label):
         log.error("Label '%s' is not valid.  Example: 'mylabel=myvalue'", label)
         sys.exit(1)
 
@@ -107,6 +106,23 @@ def main():
     logging.getLogger("sh").setLevel(logging.CRITICAL)
 
 
+def _dir_callback(default_value, dir_type, optional=False):
+    """Return a click callback that resolves a directory option once, when args are parsed."""
+
+    def callback(ctx, param, value):
+        return get_dir(value, default_value, dir_type, optional=optional)
+
+    return callback
+
+
+_template_dir_option = click.option(
+    "--template-dir",
+    "-t",
+    default=None,
+    callback=_dir_callback("templates", "template"),
+    help="Template directory (default 'templates')",
+)
+
 # Options shared by both the "deploy" command and the "process" command
 _common_options = [
     click.option("--all", "-a", "all_services", is_flag=True, help="Deploy all service sets"),
@@ -140,9 +156,7 @@ _common_options = [
         help=("(legacy) for backward compatibility. Same as using '--env' with a filename."),
         multiple=True,
     ),
-    click.option(
-        "--template-dir", "-t", default=None, help="Template directory (default 'templates')"
-    ),
+    _template_dir_option,
     click.option(
         "--scale-resources",
         type=float,
@@ -159,8 +173,11 @@ _common_options = [
         "--threadpool-size",
         "-z",
         type=int,
-        default=os.cpu_count(),
-        help="Threadpool size when running concurrent deploys (default: os.cpu_count()",
+        default=None,
+        help=(
+            "Max number of threads used for concurrent deploys and for concurrent 'oc' calls"
+            " within a stage (default: os.cpu_count())"
+        ),
     ),
 ]
 
@@ -186,19 +203,18 @@ def output_option(func):
 
 def _parse_args(template_dir, env_values, env_files, all_services, sets, pick, dst_project):
     """Parses args common to 'process' and 'deploy'."""
-    template_dir = get_dir(template_dir, "templates", "template")
+    from ocdeployer.env import EnvConfigHandler, LegacyEnvConfigHandler
 
     # Analyze the values provided by --env to determine which config handler we are using
     if env_values and env_files:
         log.error("You cannot use both --env and --env-file")
         sys.exit(1)
     elif env_values:
-        all_env_values_are_files = all([os.path.exists(value) for value in env_values])
-        some_env_values_are_files = any([os.path.exists(value) for value in env_values])
-        if all_env_values_are_files:
+        num_env_files = sum(1 for value in env_values if os.path.exists(value))
+        if num_env_files == len(env_values):
             log.info("A specific filename was provided for env, using legacy env file processing")
             env_config_handler = LegacyEnvConfigHandler(env_files=env_values)
-        elif some_env_values_are_files:
+        elif num_env_files:
             log.error("Error: Values for '--env' must be either all filenames, or all env names")
             sys.exit(1)
         else:
@@ -226,15 +242,17 @@ def _parse_args(template_dir, env_values, env_files, all_services, sets, pick, d
     if all_services:
         sets_selected = all_sets(template_dir)
     else:
+        # dict.fromkeys() de-duplicates while keeping the order the user gave
         if pick:
-            try:
-                [p.split("/")[1] for p in pick.split(",")]
-            except (ValueError, IndexError):
-                log.error("Invalid format for '--pick', use: 'service_set/component'")
-                sys.exit(1)
-            specific_components = list(set(pick.split(",")))
+            picked = pick.split(",")
+            for p in picked:
+                service_set, sep, component = p.partition("/")
+                if not service_set or not sep or not component:
+                    log.error("Invalid format for '--pick', use: 'service_set/component'")
+                    sys.exit(1)
+            specific_components = list(dict.fromkeys(picked))
         if sets:
-            sets_selected = list(set(sets.split(",")))
+            sets_selected = list(dict.fromkeys(sets.split(",")))
 
     joined_sets = ", ".join(sets_selected)
     joined_comps = ", ".join(specific_components)
@@ -284,6 +302,8 @@ def deploy_dry_run(
         template_dir, env_values, env_files, all_services, sets, pick, dst_project
     )
 
+    from ocdeployer.deploy import DeployRunner
+
     # No need to set up SecretImporter, it won't be used in a dry run
 
     DeployRunner(
@@ -328,6 +348,7 @@ def deploy_dry_run(
     "-u",
     "root_custom_dir",
     default=None,
+    callback=_dir_callback("custom", "custom scripts", optional=True),
     help="(legacy) specify root custom deploy scripts directory (default 'custom')",
 )
 @click.option(
@@ -360,7 +381,9 @@ def deploy_to_project(
     concurrent,
     threadpool_size,
 ):
-    root_custom_dir = get_dir(root_custom_dir, "custom", "custom scripts", optional=True)
+    import prompter
+    from ocdeployer.deploy import DeployRunner
+    from ocdeployer.secrets import SecretImporter
 
     if not dst_project:
         log.error("Error: no destination project given")
@@ -384,6 +407,9 @@ def deploy_to_project(
     switch_to_project(dst_project)
 
     if watch:
+        # Loading the kubernetes client is slow, only import it when the watcher is needed
+        from ocdeployer.events import start_event_watcher
+
         event_watcher = start_event_watcher(dst_project)
 
     DeployRunner(
@@ -427,10 +453,9 @@ def list_act_routes(dst_project, output):
 
 
 @main.command("list-sets", help="List service sets available in template dir")
-@click.option("--template-dir", "-t", default=None, help="Template directory (default 'templates')")
+@_template_dir_option
 @output_option
 def list_act_sets(template_dir, output):
-    template_dir = get_dir(template_dir, "templates", "template")
     return list_sets(template_dir, output)
 
 
@@ -18,14 +18,20 @@ def merge_list_of_dicts(old, new, key):
     merge_list_of_dicts(list1, list2) returns:
     [{"name": "one", "data": "newstuff"}, {"name": "two", "data": "stuff2"}]
     """
+    # Index the new items by key so each old item is matched in one lookup, the first item
+    # with a given key wins just like a linear scan of 'new' would
+    new_items_by_key = {}
+    for new_item in new:
+        new_items_by_key.setdefault(new_item[key], new_item)
+
     for old_item in reversed(old):
         matching_val = old_item[key]
-        for new_item in new:
-            if new_item[key] == matching_val:
-                object_merge(old_item, new_item)
-                break
+        new_item = new_items_by_key.get(matching_val)
+        if new_item is not None:
+            object_merge(old_item, new_item)
         else:
             new.append(old_item)
+            new_items_by_key[matching_val] = old_item
     return new
 
 
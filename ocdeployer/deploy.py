@@ -2,7 +2,8 @@
 Handles deploy logic for components
 """
 import copy
-import importlib
+import functools
+import importlib.util
 import json
 import logging
 import os
@@ -10,17 +11,85 @@ import sys
 import threading
 import yaml
 import concurrent.futures
+from collections import defaultdict
 
 from .config import merge_cfgs
 from .images import get_is_configs, import_images
-from .utils import apply_template, load_cfg_file, trigger_builds, wait_for_ready_threaded
+from .utils import (
+    SafeDumper,
+    apply_templates,
+    fast_clone,
+    load_cfg_file,
+    run_in_threadpool,
+    set_threadpool_size,
+    trigger_builds,
+    wait_for_ready_threaded,
+)
 from .secrets import import_secrets, SecretImporter
-from .templates import Template, get_templates_in_dir
+from .templates import Template, clear_cached_templates, get_cached_templates_in_dir
 
 
 log = logging.getLogger(__name__)
 
 
+def _prepare_processed_templates(
+    template_dir,
+    components,
+    variables_per_component,
+    resources_scale_factor,
+    label,
+    jinja_only=False,
+):
+    """
+    Process the templates for each component in {components}.
+
+    Returns the processed templates that have content, in the same dict format as
+    get_templates_in_dir()
+    """
+    templates_by_name = get_cached_templates_in_dir(template_dir)
+    processed_templates_by_name = {}
+
+    content_attr_name = "processed_content"
+    if jinja_only:
+        content_attr_name = "processed_jinja_content"
+
+    components = list(dict.fromkeys(components))
+    for comp_name in components:
+        if comp_name not in templates_by_name:
+            raise ValueError(
+                "Component '{}' not found in template dir '{}'".format(comp_name, template_dir)
+            )
+
+    def _process(comp_name):
+        cached_template = templates_by_name[comp_name]
+        # Read the file once on the cached instance so every copy shares its content
+        cached_template.content
+        # The cached instances are shared, so process a copy to keep results from different
+        # calls (e.g. a custom deploy() calling deploy_components() twice) independent
+        template = copy.copy(cached_template)
+        if jinja_only:
+            template.process_jinja(variables_per_component.get(comp_name, {}))
+        else:
+            template.process(
+                variables_per_component.get(comp_name, {}),
+                resources_scale_factor,
+                label,
+            )
+        return template
+
+    # Each template is processed by its own 'oc process' call, run them in parallel
+    templates = run_in_threadpool(_process, components)
+
+    for comp_name, template in zip(components, templates):
+        if not getattr(template, content_attr_name):
+            log.info("Component %s has an empty template, skipping...", comp_name)
+            continue
+
+        processed_templates_by_name[comp_name] = template
+
+    return processed_templates_by_name
+
+
 def deploy_components(
     project_name,
     template_dir,
@@ -61,26 +130,12 @@ def deploy_components(
         get_templates_in_dir()
     """
     resources_to_wait_for = []
-    templates_by_name = get_templates_in_dir(template_dir)
-    processed_templates_by_name = {}
-
-    for comp_name in components:
-        if comp_name not in templates_by_name:
-            raise ValueError(
-                "Component '{}' not found in template dir '{}'".format(comp_name, template_dir)
-            )
-
-        template = templates_by_name.get(comp_name)
-        template.process(variables_per_component.get(comp_name, {}), resources_scale_factor, label)
-
-        if not template.processed_content:
-            log.info("Component %s has an empty template, skipping...", comp_name)
-            continue
-
-        processed_templates_by_name[comp_name] = template
+    processed_templates_by_name = _prepare_processed_templates(
+        template_dir, components, variables_per_component, resources_scale_factor, label
+    )
 
+    for comp_name, template in processed_templates_by_name.items():
         log.info("Deploying component '%s'", comp_name)
-        apply_template(project_name, template)
 
         # Mark certain resources in this component as ones we need to wait on
         for restype in ("deployment", "deploymentconfig", "statefulset", "daemonset"):
@@ -88,10 +143,19 @@ def deploy_components(
                 [(restype, name) for name in template.get_processed_names_for_restype(restype)]
             )
 
-        # Re-trigger any builds for deployed build configs
-        bcs = template.get_processed_items_for_restype("bc")
-        if bcs:
-            resources_to_wait_for.extend(trigger_builds(bcs))
+    # Apply all components of this stage at once
+    if processed_templates_by_name:
+        apply_templates(project_name, list(processed_templates_by_name.values()))
+
+    # Re-trigger any builds for deployed build configs. The build configs of all components are
+    # handled together so that builds chained across components are only triggered by their parent
+    bcs = [
+        bc
+        for template in processed_templates_by_name.values()
+        for bc in template.get_processed_items_for_restype("bc")
+    ]
+    if bcs:
+        resources_to_wait_for.extend(trigger_builds(bcs))
 
     # Wait on all resources that have been marked as 'resources to wait for'
     if wait:
@@ -114,36 +178,14 @@ def _deploy_dry_run(
 
     Does not actually push any config
     """
-    templates_by_name = get_templates_in_dir(template_dir)
-    processed_templates_by_name = {}
-
-    for comp_name in components:
-        if comp_name not in templates_by_name:
-            raise ValueError(
-                "Component '{}' not found in template dir '{}'".format(comp_name, template_dir)
-            )
-
-        template = templates_by_name.get(comp_name)
-        if jinja_only:
-            template.process_jinja(variables_per_component.get(comp_name, {}))
-
-        else:
-            template.process(
-                variables_per_component.get(comp_name, {}),
-                resources_scale_factor,
-                label,
-            )
-
-        content_attr_name = "processed_content"
-        if jinja_only:
-            content_attr_name = "processed_jinja_content"
-        if not getattr(template, content_attr_name):
-            log.info("Component %s has an empty template, skipping...", comp_name)
-            continue
-
-        processed_templates_by_name[comp_name] = template
-
-    return processed_templates_by_name
+    return _prepare_processed_templates(
+        template_dir,
+        components,
+        variables_per_component,
+        resources_scale_factor,
+        label,
+        jinja_only=jinja_only,
+    )
 
 
 def deploy_dry_run(
@@ -192,10 +234,11 @@ DEFAULT_DEPLOY_METHODS = (None, deploy_components, None)
 
 
 def _load_module(path, service_set):
-    importlib.invalidate_caches()
-    spec = importlib.util.spec_from_file_location(f"deploy_{service_set}", path)
+    if not os.path.exists(path):
+        return None
 
-    if not spec or not os.path.exists(path):
+    spec = importlib.util.spec_from_file_location(f"deploy_{service_set}", path)
+    if not spec:
         return None
 
     module = importlib.util.module_from_spec(spec)
@@ -206,9 +249,12 @@ def _load_module(path, service_set):
     return module
 
 
+@functools.lru_cache(maxsize=None)
 def _get_custom_deploy_methods(service_set, service_set_dir, root_custom_dir):
     """
     Look for custom deploy module and import its methods.
+
+    A service set's custom deploy script is only located and executed once per process.
     """
     module = _load_module(os.path.join(service_set_dir, "custom", "deploy.py"), service_set)
     if not module:
@@ -223,25 +269,19 @@ def _get_custom_deploy_methods(service_set, service_set_dir, root_custom_dir):
         log.exception("Error loading custom deploy script, using default deploy methods")
         return DEFAULT_DEPLOY_METHODS
 
-    pre_deploy_method = deploy_method = post_deploy_method = None
-
-    try:
-        pre_deploy_method = getattr(module, "pre_deploy")
+    pre_deploy_method = getattr(module, "pre_deploy", None)
+    if pre_deploy_method:
         log.info("Custom pre_deploy() found for service set '%s'", service_set)
-    except AttributeError:
-        pre_deploy_method = None
 
-    try:
-        deploy_method = getattr(module, "deploy")
+    deploy_method = getattr(module, "deploy", None)
+    if deploy_method:
         log.info("Custom deploy() method found for service set '%s'", service_set)
-    except AttributeError:
+    else:
         deploy_method = deploy_components
 
-    try:
-        post_deploy_method = getattr(module, "post_deploy")
+    post_deploy_method = getattr(module, "post_deploy", None)
+    if post_deploy_method:
         log.info("Custom post_deploy() method found for service set '%s'", service_set)
-    except AttributeError:
-        post_deploy_method = None
 
     log.info(
         "Service set '%s' custom pre_deploy(): %s, custom deploy(): %s, custom post_deploy(): %s",
@@ -281,6 +321,14 @@ def generate_dry_run_content(all_processed_templates, output="yaml", to_dir=None
             log.error("Unable to create output directory '%s': %s", to_dir, str(exc))
             return
 
+    if output not in ["yaml", "json"]:
+        output = "yaml"
+    if output == "yaml":
+        dump = functools.partial(yaml.dump, Dumper=SafeDumper, default_flow_style=False)
+    else:
+        dump = functools.partial(json.dump, indent=2)
+
+    contents = []
     for service_set, processed_templates in all_processed_templates.items():
         for template_name, template_obj in processed_templates.items():
             # Check if the template_obj is an actual template... the "_imagestreams" component
@@ -293,25 +341,55 @@ def generate_dry_run_content(all_processed_templates, output="yaml", to_dir=None
             if not content:
                 log.warning("Template '%s' had no processed content", template_name)
             else:
-                if output not in ["yaml", "json"]:
-                    output = "yaml"
-                if output == "yaml":
-                    text = yaml.dump(content, default_flow_style=False)
-                else:
-                    text = json.dumps(content, indent=2)
-
-                if to_dir:
-                    service_set_dir = os.path.join(to_dir, service_set)
-                    os.makedirs(service_set_dir, exist_ok=True)
-                    file_path = os.path.join(service_set_dir, "{}.{}".format(template_name, output))
-                    with open(file_path, "w") as f:
-                        f.write(text)
-                else:
-                    print("---\n# {}/{}".format(service_set, template_name))
-                    print(text)
+                contents.append((service_set, template_name, content))
+
+    if not to_dir:
+        for service_set, template_name, content in contents:
+            # Stream the content straight to stdout rather than building the text first
+            print(f"---\n# {service_set}/{template_name}")
+            dump(content, sys.stdout)
+            print()
+        return
+
+    # Create the service set dirs up front so the files can be written concurrently
+    for service_set in {service_set for service_set, _, _ in contents}:
+        os.makedirs(os.path.join(to_dir, service_set), exist_ok=True)
+
+    def _write(service_set, template_name, content):
+        file_path = os.path.join(to_dir, service_set, f"{template_name}.{output}")
+        with open(file_path, "w") as f:
+            dump(content, f)
+
+    run_in_threadpool(lambda args: _write(*args), contents)
+
+
+def _stage_sort_key(stage):
+    stage = str(stage)
+    if stage.isdecimal():
+        # Numeric stage names sort by value so that "2" comes before "10"
+        return (0, int(stage), stage)
+    return (1, 0, stage)
+
+
+def get_stage_order(deploy_order):
+    """
+    Return the stage names of a 'deploy_order' config in the order they should be processed.
+
+    Stages are sorted by name, except that purely numeric names sort by their integer value
+    and come before any other names.
+    """
+    return sorted(deploy_order.keys(), key=_stage_sort_key)
 
 
 class DeployRunner(object):
+    """
+    Deploys the selected service sets of a template dir to a project.
+
+    Creating a runner also calls utils.set_threadpool_size() with 'threadpool_size', so the
+    module-wide limit on helper thread pools (template processing, secret imports, build
+    lookups, dry run writes) follows the most recently created runner.
+    """
+
     def __init__(
         self,
         template_dir,
@@ -327,7 +405,7 @@ class DeployRunner(object):
         dry_run=False,
         dry_run_opts=None,
         concurrent=False,
-        threadpool_size=os.cpu_count(),
+        threadpool_size=None,
     ):
         self.template_dir = template_dir
         self.root_custom_dir = root_custom_dir
@@ -338,14 +416,22 @@ class DeployRunner(object):
         self._deployed_service_sets = []
         self.specific_components = specific_components or []
         self._pick_service_sets = [comp.split("/")[0] for comp in self.specific_components]
+        self._picked_set = set(self.specific_components)
         self.label = label
         self.skip = skip
+        # Components to skip, grouped by service set
+        self._skip_by_set = defaultdict(set)
+        for entry in skip or []:
+            entry_service_set, entry_component = entry.split("/")
+            self._skip_by_set[entry_service_set].add(entry_component)
         self.dry_run = dry_run
         self.dry_run_opts = dry_run_opts or {}
         self.env_config_handler = env_config_handler
         self._base_is_configs = {}
         self.concurrent = concurrent
-        self.threadpool_size = threadpool_size
+        self.threadpool_size = threadpool_size or os.cpu_count() or 1
+        # Also bounds the thread pools used for 'oc' calls within a service set
+        set_threadpool_size(self.threadpool_size)
 
     def _get_variables(self, service_set_name, service_set_dir, component):
         variables = {}
@@ -395,19 +481,22 @@ class DeployRunner(object):
         deploy_order,
         service_set,
         dir_path,
+        templates_found,
     ):
         log.info("Entering stage '%s' of config in service set '%s'", stage, service_set)
 
         # If a component has been skipped, remove it from our component list
-        if self.skip:
-            for entry in self.skip:
-                entry_service_set, entry_component = entry.split("/")
-                if entry_service_set == service_set and entry_component in components:
-                    log.info("SKIPPING deploy for component: %s", entry_component)
-                    components.remove(entry_component)
+        skipped = self._skip_by_set.get(service_set)
+        if skipped:
+            for comp in components:
+                if comp in skipped:
+                    log.info("SKIPPING deploy for component: %s", comp)
+            components = [comp for comp in components if comp not in skipped]
+            if not components:
+                log.info("Skipping stage '%s', all of its selected components are skipped", stage)
+                return {}
 
         # Make sure all the component names have a template
-        templates_found = get_templates_in_dir(dir_path)
         for comp in components:
             if comp not in templates_found:
                 raise ValueError(
@@ -431,17 +520,24 @@ class DeployRunner(object):
         return processed_templates_this_stage
 
     def _deploy_stage(
-        self, deploy_func, variables_per_component, stage, deploy_order, service_set, dir_path
+        self,
+        deploy_func,
+        variables_per_component,
+        stage,
+        deploy_order,
+        service_set,
+        dir_path,
+        templates_found,
     ):
         components = deploy_order[stage].get("components", [])
-        comps_with_set_name = [f"{service_set}/{comp}" for comp in components]
 
+        components_to_deploy = []
         if service_set in self.service_sets_selected:
             components_to_deploy = components
-        elif self.specific_components:
+        elif self._picked_set:
             # If a component has been 'picked', deploy it
             components_to_deploy = [
-                c.split("/")[1] for c in self.specific_components if c in comps_with_set_name
+                comp for comp in components if f"{service_set}/{comp}" in self._picked_set
             ]
 
         if not components_to_deploy:
@@ -459,11 +555,12 @@ class DeployRunner(object):
             deploy_order,
             service_set,
             dir_path,
+            templates_found,
         )
 
     def _get_base_cfg(self):
         cfg_path = os.path.join(self.template_dir, "_cfg.yml")
-        if not os.path.isdir(self.template_dir) or not os.path.isfile(cfg_path):
+        if not os.path.isfile(cfg_path):
             raise ValueError(f"Unable to find config at {cfg_path}")
 
         # Load _cfg.yml from templates dir
@@ -478,7 +575,7 @@ class DeployRunner(object):
     def _get_service_set_cfg(self, service_set, dir_path):
         cfg_path = os.path.join(dir_path, "_cfg.yml")
 
-        if not os.path.isdir(dir_path) or not os.path.isfile(cfg_path):
+        if not os.path.isfile(cfg_path):
             raise ValueError(f"Unable to find config for service set at {cfg_path}")
 
         # Load _cfg.yml from service set
@@ -510,7 +607,7 @@ class DeployRunner(object):
             deploy_dry_run_func = deploy_dry_run_jinja_only if jinja_only else deploy_dry_run
             pre_deploy_func, deploy_func, post_deploy_func = None, deploy_dry_run_func, None
 
-            is_configs = copy.deepcopy(self._base_is_configs)
+            is_configs = fast_clone(self._base_is_configs)
             new_is_configs = get_is_configs(set_cfg, self.env_config_handler.env_names)
             for istag, is_config in new_is_configs.items():
                 # If an istag is imported by the base _cfg, due to the way ImageImporter works,
@@ -546,10 +643,19 @@ class DeployRunner(object):
                 variables_per_component=variables_per_component,
             )
 
-        for stage in sorted(deploy_order.keys()):
+        # The templates in the service set dir are the same for every stage, look them up once
+        templates_found = get_cached_templates_in_dir(dir_path)
+
+        for stage in get_stage_order(deploy_order):
             processed_templates.update(
                 self._deploy_stage(
-                    deploy_func, variables_per_component, stage, deploy_order, service_set, dir_path
+                    deploy_func,
+                    variables_per_component,
+                    stage,
+                    deploy_order,
+                    service_set,
+                    dir_path,
+                    templates_found,
                 )
             )
 
@@ -609,6 +715,8 @@ class DeployRunner(object):
         If 'return_immediately' is set to 'True' under a stage, then we will not wait.
         """
         self._deployed_service_sets = []
+        # Templates are cached for the duration of a run, make sure this run reads them fresh
+        clear_cached_templates()
 
         base_cfg = self._get_base_cfg()
         deploy_order = base_cfg.get("deploy_order", {})
@@ -619,9 +727,9 @@ class DeployRunner(object):
             import_images(base_cfg, self.env_config_handler.env_names)
 
         # Verify all service sets exist
-        all_service_sets = []
+        all_service_sets = set()
         for stage, stage_data in deploy_order.items():
-            all_service_sets.extend(stage_data.get("components", []))
+            all_service_sets.update(stage_data.get("components", []))
 
         sets_for_deploy = set(self.service_sets_selected + self._pick_service_sets)
 
@@ -632,7 +740,7 @@ class DeployRunner(object):
         # Deploy the service sets in proper order
         all_processed_templates = {}
 
-        for stage in sorted(deploy_order.keys()):
+        for stage in get_stage_order(deploy_order):
             service_sets = deploy_order[stage].get("components", [])
             service_sets_selected = []
             for service_set in service_sets:
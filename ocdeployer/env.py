@@ -1,4 +1,3 @@
-import copy
 import logging
 import os
 from collections import defaultdict
@@ -6,7 +5,14 @@ from collections import defaultdict
 from cached_property import cached_property
 
 from .config import merge_cfgs
-from .utils import get_cfg_files_in_dir, get_dir, load_cfg_file, object_merge
+from .utils import (
+    fast_clone,
+    get_cfg_files_in_dir,
+    get_dir,
+    load_cfg_file,
+    merge_layers,
+    object_merge,
+)
 
 
 log = logging.getLogger("ocdeployer.env")
@@ -42,8 +48,8 @@ class EnvConfigHandler:
         self.env_names = _dedupe_preserve_order(env_names)
         if len(env_names) != len(self.env_names):
             log.warning("Duplicate env names provided: %s", env_names)
-        self._last_service_set = None
-        self._last_merged_vars = None
+        # Variables with all envs merged together, per service set
+        self._merged_vars_per_service_set = {}
 
     def _load_vars_per_env(self, path=None):
         data = {}
@@ -128,7 +134,9 @@ class EnvConfigHandler:
         """
         merged_data = {}
         for env in self.env_names:
-            object_merge(data.get(env, {}), merged_data)
+            # object_merge links the old data into the result, clone it so the env data that
+            # gets merged into later on is not modified
+            object_merge(fast_clone(data.get(env, {})), merged_data)
 
         return merged_data
 
@@ -206,9 +214,7 @@ class EnvConfigHandler:
         "global" is a reserved service set name and component name
         """
         data = self._get_service_set_vars(service_set_dir, service_set)
-        merged_vars = object_merge(copy.deepcopy(self._base_vars), data)
-        self._last_service_set = service_set
-        self._last_merged_vars = merged_vars
+        merged_vars = object_merge(fast_clone(self._base_vars), data)
 
         # Don't include the '_cfg' component in this data set, it's not used for this purpose.
         if CFG in merged_vars:
@@ -246,26 +252,22 @@ class EnvConfigHandler:
         Returns:
             dict of variables/values to apply to this specific component
         """
-        if service_set == self._last_service_set:
-            merged_vars = self._last_merged_vars
-        else:
-            merged_vars = self._merge_service_set_vars(service_set_dir, service_set)
-
-        # Combine data from multiple env files (if provided) together
-        merged_vars = self._merge_environments(merged_vars)
+        merged_vars = self._merged_vars_per_service_set.get(service_set)
+        if merged_vars is None:
+            # Combine data from multiple env files (if provided) together, once per service set
+            merged_vars = self._merge_environments(
+                self._merge_service_set_vars(service_set_dir, service_set)
+            )
+            self._merged_vars_per_service_set[service_set] = merged_vars
 
         component_level_vars = merged_vars.get(service_set, {}).get(component, {})
         service_set_level_vars = merged_vars.get(service_set, {}).get(GLOBAL, {})
         global_vars = merged_vars.get(GLOBAL, {})
 
-        variables = copy.deepcopy(component_level_vars)
-        if "parameters" not in variables:
-            variables["parameters"] = {}
-
-        variables = object_merge(service_set_level_vars, variables)
-        variables = object_merge(global_vars, variables)
+        if "parameters" not in component_level_vars:
+            component_level_vars = dict(component_level_vars, parameters={})
 
-        return variables
+        return merge_layers(global_vars, service_set_level_vars, component_level_vars)
 
 
 class LegacyEnvConfigHandler(EnvConfigHandler):
@@ -1,6 +1,6 @@
 import logging
 
-from .utils import oc, get_json, validate_list_of_strs
+from .utils import oc, get_json, get_names, validate_list_of_strs
 
 
 log = logging.getLogger("ocdeployer.images")
@@ -134,13 +134,23 @@ class ImageImporter:
         )
 
     @classmethod
-    def do_import(cls, istag, image_from, scheduled, **kwargs):
+    def do_import(cls, istag, image_from, scheduled, existing_istags=None, **kwargs):
+        """
+        Import an image, re-tagging the istag if it already exists.
+
+        'existing_istags' can hold the names of all istags in the project so that they don't have
+        to be looked up one at a time.
+        """
         if istag in cls.imported_istags:
             log.warning("istag '%s' already imported, skipping repeat import...", istag)
             return
 
         scheduled = "True" if scheduled else "False"
-        if get_json("istag", istag):
+        if existing_istags is None:
+            istag_exists = bool(get_json("istag", istag))
+        else:
+            istag_exists = istag in existing_istags
+        if istag_exists:
             cls._retag_image(istag, image_from, scheduled)
         else:
             cls._import_image(istag, image_from, scheduled)
@@ -164,8 +174,14 @@ def _get_args(config, env_names):
 
 def import_images(config, env_names):
     """Import the specified images listed in a _cfg.yml"""
-    for args in _get_args(config, env_names):
-        ImageImporter.do_import(*args)
+    all_args = _get_args(config, env_names)
+    if not all_args:
+        return
+
+    # Look up the existing istags once rather than once per image
+    existing_istags = get_names("istag")
+    for args in all_args:
+        ImageImporter.do_import(*args, existing_istags=existing_istags)
 
 
 def get_is_configs(config, env_names):
@@ -1,12 +1,19 @@
 """
 Handles secrets
 """
-import json
 import logging
+import threading
 
 from ocviapy import export
 
-from .utils import oc, get_cfg_files_in_dir, get_json, load_cfg_file, validate_list_of_strs
+from .utils import (
+    get_cfg_files_in_dir,
+    get_json,
+    load_cfg_file,
+    oc,
+    run_in_threadpool,
+    validate_list_of_strs,
+)
 
 
 log = logging.getLogger(__name__)
@@ -65,7 +72,7 @@ def import_secret_from_project(project, secret_name):
         log.info("Replacing secret '%s' using secret from project '%s'", secret_name, project)
         # delete from dst ns so that applying 'null' values will work
         oc("delete", "--ignore-not-found", "secret", secret_name, _silent=True)
-        oc("apply", "-f", "-", _in=json.dumps(desired_secret), _silent=True)
+        oc("apply", "-f", "-", _in=desired_secret, _silent=True)
 
 
 def import_secret_from_local_storage(secret_name, local_secret_data):
@@ -79,7 +86,7 @@ def import_secret_from_local_storage(secret_name, local_secret_data):
         log.info("Replacing secret '%s' using local storage", secret_name)
         # delete from dst ns so that applying 'null' values will work
         oc("delete", "--ignore-not-found", "secret", secret_name, _silent=True)
-        oc("apply", "-f", "-", _silent=True, _in=json.dumps(local_secret_data))
+        oc("apply", "-f", "-", _silent=True, _in=local_secret_data)
 
 
 def parse_config(config):
@@ -109,7 +116,7 @@ class SecretImporter(object):
     """
     A singleton which handles importing secrets.
 
-    Keeps track of which secrets have been imported so we don't keep re-importing.
+    Keeps track of which secrets have been imported and linked so we don't keep repeating it.
     """
 
     source_project = None
@@ -117,6 +124,10 @@ class SecretImporter(object):
     local_secrets_data = None
     local_secrets_loaded = False
     handled_secret_names = []
+    linked_secrets = set()
+    _local_secrets_lock = threading.Lock()
+    # One lock per service account, held while linking secrets to it
+    _sa_locks = {}
 
     @staticmethod
     def _get_secret(name):
@@ -125,7 +136,11 @@ class SecretImporter(object):
     @classmethod
     def _import(cls, name):
         if cls.local_dir and not cls.local_secrets_loaded:
-            cls.local_secrets_data = import_secrets_from_dir(cls.local_dir)
+            # Secrets may be handled from several threads, only read the local dir once
+            with cls._local_secrets_lock:
+                if not cls.local_secrets_loaded:
+                    cls.local_secrets_data = import_secrets_from_dir(cls.local_dir)
+                    cls.local_secrets_loaded = True
 
         if cls.local_secrets_data:
             for secret_name, secret_data in cls.local_secrets_data.items():
@@ -139,36 +154,68 @@ class SecretImporter(object):
             cls.handled_secret_names.append(name)
 
     @classmethod
-    def handle(cls, name, link=None, verify=False, **kwargs):
+    def check_or_import(cls, name):
         """
-        Import secret to openshift project and optionally link to service accounts.
+        Make sure secret 'name' is present in the openshift project, importing it if needed.
 
         If local_dir is defined, this tries to import all secrets in that dir first. If the
         secret we want is still not imported, we try to import from source_project instead
         """
+        # Secrets referenced by more than one _cfg.yml are only checked/imported once
+        if name in cls.handled_secret_names:
+            return
+
         if not cls.local_dir and not cls.source_project:
             if not cls._get_secret(name):
                 raise Exception(
-                    f"Required secret '{name}' is missing in namespace and secret importing has"
-                    " not been enabled via --secrets-src-project or --secrets-local-dir"
+                    f"Required secret '{name}' is missing in namespace and secret importing"
+                    " has not been enabled via --secrets-src-project or --secrets-local-dir"
                 )
             cls.handled_secret_names.append(name)
-
-        if name not in cls.handled_secret_names:
+        else:
             cls._import(name)
 
-        if link:
-            for sa in link:
+    @classmethod
+    def link(cls, name, link):
+        """
+        Link secret 'name' to each service account in 'link'.
+
+        'oc secrets link' rewrites the whole service account, so links to the same service
+        account are made one at a time to avoid update conflicts.
+        """
+        for sa in link or []:
+            with cls._sa_locks.setdefault(sa, threading.Lock()):
+                if (name, sa) in cls.linked_secrets:
+                    continue
                 oc("secrets", "link", sa, name, "--for=pull,mount")
+                cls.linked_secrets.add((name, sa))
+
+    @classmethod
+    def handle(cls, name, link=None, verify=False, **kwargs):
+        """
+        Import secret to openshift project and optionally link to service accounts.
+        """
+        cls.check_or_import(name)
+        cls.link(name, link)
 
 
 def import_secrets(config, env_names):
     """Import the specified secrets listed in a _cfg.yml"""
-    secrets = parse_config(config)
-    for secret in secrets:
+    secrets = []
+    for secret in parse_config(config):
         if not secret["envs"] or any([e in env_names for e in secret["envs"]]):
-            SecretImporter.handle(**secret)
+            secrets.append(secret)
         else:
             log.info(
                 "Skipping check/import of secret '%s', not enabled for this env", secret["name"]
             )
+
+    if not secrets:
+        return
+
+    # Each secret needs a few 'oc' round trips, so check/import them concurrently
+    run_in_threadpool(SecretImporter.check_or_import, [secret["name"] for secret in secrets])
+
+    # Linking edits the service accounts, so it is done one secret at a time
+    for secret in secrets:
+        SecretImporter.link(secret["name"], secret["link"])
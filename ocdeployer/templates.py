@@ -1,6 +1,7 @@
 """
 Helper methods for dealing with openshift template
 """
+import functools
 import os
 import json
 import logging
@@ -10,7 +11,7 @@ import yaml
 from cached_property import cached_property
 from jinja2 import Template as Jinja2Template
 
-from .utils import oc, parse_restype, get_cfg_files_in_dir
+from .utils import SafeLoader, oc, parse_restype, get_cfg_files_in_dir
 
 
 log = logging.getLogger(__name__)
@@ -31,6 +32,40 @@ def get_templates_in_dir(path):
     return template_for_name
 
 
+@functools.lru_cache(maxsize=64)
+def _get_templates_in_dir_cached(path, mtime_ns):
+    return get_templates_in_dir(path)
+
+
+def get_cached_templates_in_dir(path):
+    """
+    Same as get_templates_in_dir(), but the Template instances found in a directory are re-used
+    until a template file is added to or removed from it.
+
+    Changes are noticed through the directory's mtime. That misses files edited in place, and
+    on filesystems with coarse mtimes (e.g. 1 second on NFS, ext3 or HFS+) it can also miss
+    files added right after a lookup. This is why DeployRunner.run() clears the cache with
+    clear_cached_templates() before every run.
+
+    The returned dict is shared, callers must not modify it.
+    """
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except OSError:
+        return get_templates_in_dir(path)
+    return _get_templates_in_dir_cached(os.path.abspath(path), mtime_ns)
+
+
+def clear_cached_templates():
+    """
+    Forget the Template instances cached by get_cached_templates_in_dir().
+
+    A template file edited in place doesn't change its directory's mtime, so the cache should be
+    cleared whenever templates need to be read again from disk (e.g. at the start of a deploy).
+    """
+    _get_templates_in_dir_cached.cache_clear()
+
+
 def _scale_val(val, scale_factor):
     """
     Parse out the number from a kubernetes resource string and scale it by scale_factor
@@ -230,14 +265,14 @@ class Template(object):
             "json",
             *extra_args,
             _silent=True,
-            _in=json.dumps(content)
+            _in=content
         )
 
         return json.loads(str(output))
 
     def _load_content(self, string):
         if self.path.endswith(".yml") or self.path.endswith(".yaml"):
-            content = yaml.safe_load(string)
+            content = yaml.load(string, Loader=SafeLoader)
         else:
             content = json.loads(string)
 
@@ -1,6 +1,9 @@
 from __future__ import print_function
 
-import glob
+import concurrent.futures
+import copy
+import datetime
+import functools
 import json
 import logging
 import sys
@@ -9,13 +12,19 @@ import time
 import os
 import yaml
 import re
-from functools import reduce
+import stat
 
 from anytree import Node, RenderTree, PreOrderIter
 import sh
 from sh import ErrorReturnCode, TimeoutException
 from wait_for import wait_for, TimedOutError
 
+try:
+    # Use the libyaml-backed loader/dumper when PyYAML was built with it
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper  # noqa: F401
+except ImportError:
+    from yaml import SafeLoader, SafeDumper  # noqa: F401
+
 log = logging.getLogger(__name__)
 
 # Resource types and their cli shortcuts
@@ -74,6 +83,29 @@ def validate_list_of_strs(item_name, section, list_):
         raise ValueError(f"'{item_name}' in '{section}' is not a list of strings")
 
 
+# Scalar types produced by the YAML/JSON loaders, these never need to be copied
+_IMMUTABLE_TYPES = frozenset(
+    (str, int, float, bool, bytes, type(None), datetime.date, datetime.datetime)
+)
+
+
+def fast_clone(obj):
+    """
+    Deep copy parsed config data made of dicts, lists and scalars.
+
+    This skips the generic copy protocol and memo bookkeeping of copy.deepcopy, which is several
+    times slower on this kind of data. Any other type is handed to copy.deepcopy.
+    """
+    obj_type = type(obj)
+    if obj_type is dict:
+        return {key: fast_clone(value) for key, value in obj.items()}
+    if obj_type is list:
+        return [fast_clone(value) for value in obj]
+    if obj_type in _IMMUTABLE_TYPES:
+        return obj
+    return copy.deepcopy(obj)
+
+
 def object_merge(old, new, merge_lists=True):
     """
     Recursively merge two data structures
@@ -93,6 +125,33 @@ def object_merge(old, new, merge_lists=True):
     return new
 
 
+def merge_layers(*layers):
+    """
+    Recursively merge several data structures, later layers take precedence over earlier ones.
+
+    Gives the same result as chaining object_merge() from the lowest layer up, but walks the data
+    once and builds new dicts/lists instead of modifying the layers or linking them into the result.
+    """
+    return _merge_layers(layers[::-1])
+
+
+def _merge_layers(layers):
+    # 'layers' holds the values found for one key, highest precedence first
+    top = layers[0]
+    if isinstance(top, dict):
+        dicts = [layer for layer in layers if isinstance(layer, dict)]
+        merged = {}
+        for layer in dicts:
+            for key in layer:
+                if key not in merged:
+                    merged[key] = _merge_layers([d[key] for d in dicts if key in d])
+        return merged
+    if isinstance(top, list):
+        lists = [layer for layer in layers if isinstance(layer, list)]
+        return [fast_clone(item) for layer in reversed(lists) for item in layer]
+    return fast_clone(top)
+
+
 def traverse_keys(d, keys, default=None):
     """
     Allows you to look up a 'path' of keys in nested dicts without knowing whether each key exists
@@ -127,21 +186,25 @@ def get_cfg_files_in_dir(path):
 
     Ignore the special _cfg file
     """
-    files = list(glob.glob(os.path.join(path, "*.yaml")))
-    files.extend(list(glob.glob(os.path.join(path, "*.yml"))))
-    files.extend(list(glob.glob(os.path.join(path, "*.json"))))
-    return [f for f in files if not os.path.basename(f).startswith("_cfg")]
-
+    # Scan the dir once, keeping the grouping by extension that separate globs would give
+    files_by_ext = {".yaml": [], ".yml": [], ".json": []}
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                ext = os.path.splitext(entry.name)[1]
+                if ext in files_by_ext and not entry.name.startswith((".", "_cfg")):
+                    files_by_ext[ext].append(os.path.join(path, entry.name))
+    except OSError:
+        return []
+    return [f for files in files_by_ext.values() for f in files]
 
-def load_cfg_file(path):
-    if not os.path.isfile(path):
-        raise ValueError("Path '{}' is not a file or does not exist".format(path))
 
+def _parse_cfg_file(path):
     _, file_ext = os.path.splitext(path)
 
     with open(path, "rb") as f:
         if file_ext == ".yaml" or file_ext == ".yml":
-            content = yaml.safe_load(f)
+            content = yaml.load(f, Loader=SafeLoader)
         elif file_ext == ".json":
             content = json.load(f)
         else:
@@ -153,29 +216,56 @@ def load_cfg_file(path):
     return content
 
 
+@functools.lru_cache(maxsize=128)
+def _load_cfg_cached(path, mtime_ns, size):
+    """Parse a config file, memoized on its (absolute path, mtime, size)."""
+    return _parse_cfg_file(path)
+
+
+def load_cfg_file(path, mutable=True):
+    """
+    Load a YAML/JSON file and return its parsed content.
+
+    Each file is parsed at most once per process, the parsed content is cached and re-used until
+    the file's mtime or size changes.
+
+    If 'mutable' is False, the cached object itself is returned and the caller must not modify
+    it. Otherwise a copy of the cached content is returned.
+    """
+    # A single stat both checks the path and provides the cache key
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        file_stat = None
+    if not file_stat or not stat.S_ISREG(file_stat.st_mode):
+        raise ValueError("Path '{}' is not a file or does not exist".format(path))
+
+    content = _load_cfg_cached(os.path.abspath(path), file_stat.st_mtime_ns, file_stat.st_size)
+
+    return fast_clone(content) if mutable else content
+
+
 def get_dir(value, default_value, dir_type, optional=False):
     path = value or default_value
-    required_dir_does_not_exist = not optional and not os.path.exists(path)
-    required_dir_is_not_a_dir = not optional and not os.path.isdir(path)
-    path_exists_but_not_a_dir = os.path.exists(path) and not os.path.isdir(path)
-    if required_dir_does_not_exist:
+    path_exists = os.path.exists(path)
+    if not optional and not path_exists:
         log.error("%s directory missing: %s", dir_type, path)
         abort()
-    if required_dir_is_not_a_dir or path_exists_but_not_a_dir:
+    if path_exists and not os.path.isdir(path):
         log.error("%s directory invalid: %s", dir_type, path)
         abort()
     path = os.path.abspath(path)
-    if os.path.exists(path):
+    if path_exists:
         log.info("Found %s path: %s", dir_type, path)
     return path
 
 
 def all_sets(template_dir):
     try:
-        cfg_data = load_cfg_file(f"{template_dir}/_cfg.yaml")
+        cfg_data = load_cfg_file(f"{template_dir}/_cfg.yaml", mutable=False)
     except ValueError:
         try:
-            cfg_data = load_cfg_file(f"{template_dir}/_cfg.yml")
+            cfg_data = load_cfg_file(f"{template_dir}/_cfg.yml", mutable=False)
         except ValueError as err:
             log.error("Error: template dir '%s' invalid: %s", template_dir, str(err))
             abort()
@@ -183,12 +273,10 @@ def all_sets(template_dir):
     try:
         stages = cfg_data["deploy_order"]
     except KeyError:
-        log.error("Error: template dir '%s' invalid: _cfg file has no 'deploy_order'")
+        log.error("Error: template dir '%s' invalid: _cfg file has no 'deploy_order'", template_dir)
         abort()
 
-    sets = reduce(lambda acc, s: acc + s.get("components", []), stages.values(), [])
-
-    return sets
+    return [service_set for stage in stages.values() for service_set in stage.get("components", [])]
 
 
 def _only_immutable_errors(err_lines):
@@ -224,6 +312,10 @@ def _exec_oc(*args, **kwargs):
     _stdout_log_prefix = kwargs.pop("_stdout_log_prefix", " |stdout| ")
     _stderr_log_prefix = kwargs.pop("_stderr_log_prefix", " |stderr| ")
 
+    # Serialize structured input once, compactly, so retries re-use the same payload
+    if isinstance(kwargs.get("_in"), (dict, list)):
+        kwargs["_in"] = json.dumps(kwargs["_in"], separators=(",", ":"))
+
     kwargs["_bg"] = True
     kwargs["_bg_exc"] = False
 
@@ -303,6 +395,7 @@ def oc(*args, **kwargs):
         _retry_conflicts: retry commands if a conflict error is hit
         _stdout_log_prefix: prefix this string to stdout log output (default " |stdout| ")
         _stderr_log_prefix: prefix this string to stderr log output (default " |stderr| ")
+        _in: stdin for the command, a dict or list is sent as compact JSON
 
     Returns:
         None if cmd fails and _exit_on_err is False
@@ -324,9 +417,19 @@ def oc(*args, **kwargs):
                 log.warning("Non-zero return code ignored")
 
 
-def apply_template(project, template):
+def apply_templates(project, templates):
+    """
+    Apply the processed content of several templates to a project using a single 'oc apply'
+    """
+    content = {
+        "kind": "List",
+        "apiVersion": "v1",
+        "items": [
+            item for template in templates for item in template.processed_content.get("items", [])
+        ],
+    }
     try:
-        oc("apply", "-f", "-", "-n", project, _in=template.dump_processed_json(), _reraise=True)
+        oc("apply", "-f", "-", "-n", project, _in=content, _reraise=True)
     except ErrorReturnCode as err:
         # Work-around for resourceVersion errors.
         # See https://www.timcosta.io/kubernetes-service-invalid-clusterip-or-resourceversion/
@@ -334,7 +437,8 @@ def apply_template(project, template):
         if matches:
             for restype, name in matches:
                 restype = restype.rstrip("s")  # remove plural language
-                if template.get_processed_item(restype, name):  # ensure we sent this item's config
+                # ensure we sent this item's config
+                if any(template.get_processed_item(restype, name) for template in templates):
                     log.warning(
                         "Removing last-applied-configuration annotation from %s/%s", restype, name
                     )
@@ -344,11 +448,15 @@ def apply_template(project, template):
                         name,
                         "kubectl.kubernetes.io/last-applied-configuration-",
                     )
-            oc("apply", "-f", "-", "-n", project, _in=template.dump_processed_json())
+            oc("apply", "-f", "-", "-n", project, _in=content)
         else:
             abort()
 
 
+def apply_template(project, template):
+    apply_templates(project, [template])
+
+
 def switch_to_project(project):
     try:
         oc("get", "project", project, _reraise=True)
@@ -358,13 +466,15 @@ def switch_to_project(project):
     oc("project", project, _exit_on_err=True)
 
 
-def get_json(restype, name=None, label=None):
+def get_json(restype, name=None, label=None, namespace=None):
     """
     Run 'oc get' for a given resource type/name/label and return the json output.
 
     If name is None all resources of this type are returned
 
     If label is not provided, then "oc get" will not be filtered on label
+
+    If namespace is not provided, the current project is used
     """
     restype = parse_restype(restype)
 
@@ -373,6 +483,8 @@ def get_json(restype, name=None, label=None):
         args.append(name)
     if label:
         args.extend(["-l", label])
+    if namespace:
+        args.extend(["-n", namespace])
     try:
         output = oc(*args, o="json", _exit_on_err=False, _silent=True)
     except ErrorReturnCode as err:
@@ -387,6 +499,27 @@ def get_json(restype, name=None, label=None):
     return parsed_json
 
 
+def get_names(restype, namespace=None):
+    """
+    Return the set of names of all resources of a given type.
+
+    Only the names are requested from the server, which keeps the response small compared to
+    get_json() for resource types with large objects (e.g. istags).
+
+    If namespace is not provided, the current project is used
+    """
+    restype = parse_restype(restype)
+
+    args = ["get", restype, "-o", "jsonpath={.items[*].metadata.name}"]
+    if namespace:
+        args.extend(["-n", namespace])
+    output = oc(*args, _exit_on_err=False, _silent=True)
+    if output is None:
+        return set()
+
+    return set(str(output).split())
+
+
 def rollout(dc_name):
     """Rollout a deployment, wait for new revision to start deploying, wait for it to go active."""
 
@@ -413,13 +546,13 @@ def rollout(dc_name):
     wait_for_ready("dc", dc_name)
 
 
-def get_routes():
+def get_routes(namespace=None):
     """
-    Get all routes in the project.
+    Get all routes in the project, or in 'namespace' if given.
 
     Return dict with key of service name, value of http route
     """
-    data = get_json("route")
+    data = get_json("route", namespace=namespace)
     ret = {}
     for route in data.get("items", []):
         ret[route["metadata"]["name"]] = route["spec"]["host"]
@@ -597,6 +730,43 @@ def wait_for_ready(restype, name, timeout=300, exit_on_err=False, _result_dict=N
     return False
 
 
+# Max number of workers run_in_threadpool() runs at once, shared by all of its callers
+_threadpool_size = os.cpu_count() or 1
+_threadpool_semaphore = threading.BoundedSemaphore(_threadpool_size)
+
+
+def set_threadpool_size(size):
+    """Set the max number of workers that run_in_threadpool() runs at once."""
+    global _threadpool_size, _threadpool_semaphore
+    _threadpool_size = size
+    _threadpool_semaphore = threading.BoundedSemaphore(size)
+
+
+def run_in_threadpool(func, items):
+    """
+    Call 'func' for each item in 'items' on a thread pool and return the results in order.
+
+    The limit set by set_threadpool_size() applies across all callers, so pools started by
+    service sets that deploy concurrently share it. Workers take the name of the calling
+    thread so that their log lines are attributed to the same service set.
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    caller_name = threading.current_thread().name
+    semaphore = _threadpool_semaphore
+
+    def _run(item):
+        threading.current_thread().name = caller_name
+        with semaphore:
+            return func(item)
+
+    max_workers = min(_threadpool_size, len(items))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_run, items))
+
+
 def wait_for_ready_threaded(restype_name_list, timeout=300, exit_on_err=False):
     """
     Wait for multiple delpoyments in a threaded fashion.
@@ -736,22 +906,35 @@ def start_deployment(dc_name, timeout=180):
     )
 
 
+@functools.lru_cache(maxsize=1)
 def get_server_info():
-    """Return server connected on"""
+    """Return server connected on (looked up once per invocation)"""
     return oc("whoami", "--show-server", _silent=True)
 
 
-def cancel_builds(bc_name):
+def cancel_builds(*bc_names):
+    """
+    Cancel any new/pending/running builds for one or more build configs.
+
+    All build configs are handled by one 'oc cancel-build' and one lookup of lingering builds.
+    """
+    if not bc_names:
+        return
+
     oc(
         "cancel-build",
-        f"bc/{bc_name}",
+        *[f"bc/{bc_name}" for bc_name in bc_names],
         state="new,pending,running",
         _timeout=120,
         _exit_on_err=False,
     )
 
     # Check if there's any lingering builds
-    builds = get_json("build", label=f"openshift.io/build-config.name={bc_name}")
+    if len(bc_names) == 1:
+        label = f"openshift.io/build-config.name={bc_names[0]}"
+    else:
+        label = "openshift.io/build-config.name in ({})".format(",".join(bc_names))
+    builds = get_json("build", label=label)
     lingering_builds = []
     for build in builds.get("items", []):
         # delete these builds rather than cancelling them, since jenkins pipeline builds
@@ -759,13 +942,12 @@ def cancel_builds(bc_name):
         status = build.get("status") or {}
         phase = status.get("phase", "").lower()
         if phase in ["new", "pending"]:
-            build_name = build["metadata"]["name"]
-            lingering_builds.append(build_name)
+            lingering_builds.append(build["metadata"])
 
-    if lingering_builds:
-        log.warning("Found lingering builds for bc/%s which will be deleted", bc_name)
-        for build_name in lingering_builds:
-            oc("delete", "build", build_name)
+    for metadata in lingering_builds:
+        bc_name = metadata.get("labels", {}).get("openshift.io/build-config.name")
+        log.warning("Found lingering build for bc/%s which will be deleted", bc_name)
+        oc("delete", "build", metadata["name"])
 
 
 def get_input_image(buildconfig, trigger):
@@ -863,17 +1045,20 @@ def trigger_builds(buildconfigs):
     """
     Trigger parent build configs based on a build tree and return the resources to wait for
     """
-    bcs = buildconfigs
+    build_tree = get_build_tree(buildconfigs)
+    bc_names = [bc_name for sub_tree in build_tree for bc_name in sub_tree]
+    if not bc_names:
+        return []
+
+    # Cancel any new/pending builds for all build configs at once
+    cancel_builds(*bc_names)
 
-    builds_to_wait_for = []
+    # Looking up the next build is independent per build config, run the lookups in parallel
+    next_builds = run_in_threadpool(get_next_build, bc_names)
+    builds_to_wait_for = [("build", next_build) for next_build in next_builds]
 
-    build_tree = get_build_tree(bcs)
     for sub_tree in build_tree:
         parent = sub_tree[0]
-        for bc_name in sub_tree:
-            # Cancel any new/pending builds
-            cancel_builds(bc_name)
-            builds_to_wait_for.append(("build", get_next_build(bc_name)))
         log.info("triggering build for '%s'", parent)
         oc("start-build", "bc/{}".format(parent))
 
@@ -1,9 +1,12 @@
 import pytest
+import json
 import os
 
 from ocdeployer.secrets import SecretImporter
+from ocdeployer import deploy as deploy_module
 from ocdeployer.deploy import DeployRunner
 from ocdeployer.env import EnvConfigHandler, LegacyEnvConfigHandler
+from ocdeployer.templates import Template
 
 
 def patched_runner(env_values, mock_load_vars_per_env, legacy=False):
@@ -613,3 +616,227 @@ def test__get_variables_multiple_envs_precedence_reversed(patch_os_path):
         ["test_env2", "test_env1"], build_mock_env_loader(base_var_data, service_set_var_data),
     )
     assert runner._get_variables("service", "templates/service", "component") == expected
+
+
+def test__deploy_stage_skip(mocker):
+    runner = DeployRunner(
+        "templatesTEST",
+        "test-project",
+        None,
+        None,
+        ["service"],
+        None,
+        None,
+        skip=["service/comp2", "other/comp1"],
+    )
+    deploy_func = mocker.Mock(return_value={})
+    deploy_order = {"stage1": {"components": ["comp1", "comp2"]}}
+    templates_found = {"comp1": None, "comp2": None}
+
+    runner._deploy_stage(
+        deploy_func,
+        {},
+        "stage1",
+        deploy_order,
+        "service",
+        "templatesTEST/service",
+        templates_found,
+    )
+
+    assert deploy_func.call_args[1]["components"] == ["comp1"]
+    assert deploy_order["stage1"]["components"] == ["comp1", "comp2"]
+
+
+def test__deploy_stage_all_skipped(mocker):
+    runner = DeployRunner(
+        "templatesTEST",
+        "test-project",
+        None,
+        None,
+        ["service"],
+        None,
+        None,
+        skip=["service/comp1"],
+    )
+    deploy_func = mocker.Mock(return_value={})
+    deploy_order = {"stage1": {"components": ["comp1"]}}
+
+    assert (
+        runner._deploy_stage(
+            deploy_func, {}, "stage1", deploy_order, "service", "templatesTEST/service", {}
+        )
+        == {}
+    )
+    deploy_func.assert_not_called()
+
+
+def test__deploy_stage_picked(mocker):
+    runner = DeployRunner(
+        "templatesTEST",
+        "test-project",
+        None,
+        None,
+        [],
+        None,
+        None,
+        specific_components=["service/comp3", "service/comp1", "other/comp2"],
+    )
+    deploy_func = mocker.Mock(return_value={})
+    deploy_order = {"stage1": {"components": ["comp1", "comp2", "comp3"]}}
+    templates_found = {"comp1": None, "comp2": None, "comp3": None}
+
+    runner._deploy_stage(
+        deploy_func, {}, "stage1", deploy_order, "service", "templatesTEST/service", templates_found
+    )
+
+    assert deploy_func.call_args[1]["components"] == ["comp1", "comp3"]
+
+
+def test__deploy_stage_not_selected(mocker):
+    runner = DeployRunner("templatesTEST", "test-project", None, None, ["other"], None, None)
+    deploy_func = mocker.Mock(return_value={})
+    deploy_order = {"stage1": {"components": ["comp1"]}}
+
+    assert (
+        runner._deploy_stage(
+            deploy_func, {}, "stage1", deploy_order, "service", "templatesTEST/service", {}
+        )
+        == {}
+    )
+    deploy_func.assert_not_called()
+
+
+def test_deploy_components_triggers_builds_once(mocker):
+    def _template(items):
+        template = mocker.Mock()
+        template.get_processed_items_for_restype.side_effect = lambda restype: (
+            items if restype == "bc" else []
+        )
+        template.get_processed_names_for_restype.return_value = []
+        return template
+
+    templates = {"comp1": _template([{"name": "bc1"}]), "comp2": _template([{"name": "bc2"}])}
+    mocker.patch("ocdeployer.deploy._prepare_processed_templates", return_value=templates)
+    apply_templates = mocker.patch("ocdeployer.deploy.apply_templates")
+    trigger_builds = mocker.patch(
+        "ocdeployer.deploy.trigger_builds", return_value=[("build", "bc1-2")]
+    )
+    wait = mocker.patch("ocdeployer.deploy.wait_for_ready_threaded")
+
+    deploy_module.deploy_components("test-project", "templatesTEST", ["comp1", "comp2"], {})
+
+    apply_templates.assert_called_once_with("test-project", list(templates.values()))
+    trigger_builds.assert_called_once_with([{"name": "bc1"}, {"name": "bc2"}])
+    wait.assert_called_once_with([("build", "bc1-2")], timeout=300, exit_on_err=True)
+
+
+def test__get_custom_deploy_methods_loads_once(tmp_path, mocker):
+    custom_dir = tmp_path / "service" / "custom"
+    custom_dir.mkdir(parents=True)
+    (custom_dir / "deploy.py").write_text("def deploy(**kwargs):\n    return {}\n")
+    load_module = mocker.spy(deploy_module, "_load_module")
+
+    methods = deploy_module._get_custom_deploy_methods(
+        "service", str(tmp_path / "service"), str(tmp_path / "custom")
+    )
+    assert methods[0] is None and methods[2] is None
+    assert methods[1].__module__ == "deploy_service"
+    assert (
+        deploy_module._get_custom_deploy_methods(
+            "service", str(tmp_path / "service"), str(tmp_path / "custom")
+        )
+        is methods
+    )
+    assert load_module.call_count == 1
+
+
+def test__get_variables_merges_envs_once_per_service_set(patch_os_path, mocker):
+    base_var_data = {
+        "test_env": {"global": {"global_var": "base_global1", "list_var": ["a"]}},
+        "test_env2": {"global": {"global_var": "base_global2", "list_var": ["b"]}},
+    }
+
+    runner = patched_runner(["test_env", "test_env2"], build_mock_env_loader(base_var_data))
+    merge_environments = mocker.spy(runner.env_config_handler, "_merge_environments")
+
+    first = runner._get_variables("service", "templates/service", "component1")
+    second = runner._get_variables("service", "templates/service", "component2")
+
+    assert merge_environments.call_count == 1
+    assert first["list_var"] == second["list_var"] == ["b", "a"]
+    assert base_var_data["test_env"]["global"]["list_var"] == ["a"]
+
+
+def _patch_template_process(mocker):
+    def _process(template, variables, resources_scale_factor=1.0, label=None):
+        template.processed_content = {"items": [variables]} if variables else {}
+        return template.processed_content
+
+    return mocker.patch.object(Template, "process", autospec=True, side_effect=_process)
+
+
+def test_deploy_dry_run_processes_components(mocker):
+    templates = {"comp1": Template("comp1.yml"), "comp2": Template("comp2.yml")}
+    mocker.patch("ocdeployer.deploy.get_cached_templates_in_dir", return_value=templates)
+    mocker.patch.object(Template, "content", "")
+    process = _patch_template_process(mocker)
+
+    processed = deploy_module.deploy_dry_run(
+        "test-project", "templatesTEST/service", ["comp1", "comp2"], {"comp1": {"A": "b"}}
+    )
+
+    assert list(processed) == ["comp1"]
+    assert processed["comp1"].processed_content == {"items": [{"A": "b"}]}
+    assert process.call_count == 2
+
+
+def test_deploy_dry_run_does_not_modify_cached_templates(mocker):
+    templates = {"comp1": Template("comp1.yml")}
+    mocker.patch("ocdeployer.deploy.get_cached_templates_in_dir", return_value=templates)
+    mocker.patch.object(Template, "content", "")
+    _patch_template_process(mocker)
+
+    first = deploy_module.deploy_dry_run(
+        "test-project", "templatesTEST/service", ["comp1"], {"comp1": {"A": "b"}}
+    )
+    second = deploy_module.deploy_dry_run(
+        "test-project", "templatesTEST/service", ["comp1"], {"comp1": {"A": "c"}}
+    )
+
+    assert first["comp1"].processed_content == {"items": [{"A": "b"}]}
+    assert second["comp1"].processed_content == {"items": [{"A": "c"}]}
+    assert templates["comp1"].processed_content == {}
+
+
+def test_get_stage_order():
+    deploy_order = {"10": {}, "stage1": {}, 2: {}, "1": {}, "stage0": {}}
+    assert deploy_module.get_stage_order(deploy_order) == ["1", 2, "10", "stage0", "stage1"]
+    assert deploy_module.get_stage_order({"\u00b2": {}, "1": {}}) == ["1", "\u00b2"]
+
+
+def test_generate_dry_run_content_to_dir(tmp_path):
+    all_processed_templates = {
+        "set1": {"_imagestreams": {"kind": "List", "items": []}, "empty": {}},
+        "set2": {"_imagestreams": {"kind": "List", "items": [{"kind": "ImageStream"}]}},
+    }
+
+    deploy_module.generate_dry_run_content(
+        all_processed_templates, output="json", to_dir=str(tmp_path)
+    )
+
+    assert sorted(os.listdir(str(tmp_path))) == ["set1", "set2"]
+    assert os.listdir(str(tmp_path / "set1")) == ["_imagestreams.json"]
+    assert json.loads((tmp_path / "set2" / "_imagestreams.json").read_text()) == {
+        "kind": "List",
+        "items": [{"kind": "ImageStream"}],
+    }
+
+
+def test_deploy_runner_threadpool_size_without_cpu_count(mocker):
+    mocker.patch("ocdeployer.deploy.os.cpu_count", return_value=None)
+    set_threadpool_size = mocker.patch("ocdeployer.deploy.set_threadpool_size")
+
+    runner = DeployRunner("templatesTEST", "test-project", None, None, [], None, None)
+
+    assert runner.threadpool_size == 1
+    set_threadpool_size.assert_called_once_with(1)
@@ -6,7 +6,7 @@ from ocdeployer.images import ImageImporter, import_images
 @pytest.fixture
 def mock_oc(mocker):
     _mock_oc = mocker.patch("ocdeployer.images.oc")
-    mocker.patch("ocdeployer.images.get_json", return_value={})
+    mocker.patch("ocdeployer.images.get_names", return_value=set())
     yield _mock_oc
 
 
@@ -125,3 +125,38 @@ def test_images_conditional_ignore_image(mocker, mock_oc):
         )
     ]
     mock_oc.assert_has_calls(calls)
+
+
+def test_images_existing_istag_retagged(mocker, mock_oc):
+    get_names = mocker.patch("ocdeployer.images.get_names", return_value={"image1:tag"})
+    config_content = {
+        "images": [
+            {"istag": "image1:tag", "from": "docker.url/image1:sometag"},
+            {"istag": "image2:tag", "from": "docker.url/image2:sometag"},
+        ]
+    }
+
+    ImageImporter.imported_istags = []
+    import_images(config_content, [])
+
+    get_names.assert_called_once_with("istag")
+    assert mock_oc.call_count == 3
+    calls = [
+        mocker.call(
+            "tag",
+            "--scheduled=True",
+            "--source=docker",
+            "docker.url/image1:sometag",
+            "image1:tag",
+        ),
+        mocker.call("import-image", "image1:tag"),
+        mocker.call(
+            "import-image",
+            "image2:tag",
+            "--from=docker.url/image2:sometag",
+            "--confirm",
+            "--scheduled=True",
+            _reraise=True,
+        ),
+    ]
+    mock_oc.assert_has_calls(calls)
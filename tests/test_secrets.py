@@ -0,0 +1,67 @@
+import pytest
+
+from ocdeployer.secrets import SecretImporter, import_secrets
+
+
+@pytest.fixture
+def secret_importer(mocker):
+    mocker.patch.object(SecretImporter, "source_project", None)
+    mocker.patch.object(SecretImporter, "local_dir", "secretsTEST")
+    mocker.patch.object(SecretImporter, "local_secrets_data", None)
+    mocker.patch.object(SecretImporter, "local_secrets_loaded", False)
+    mocker.patch.object(SecretImporter, "handled_secret_names", [])
+    mocker.patch.object(SecretImporter, "linked_secrets", set())
+    yield SecretImporter
+
+
+def test_import_secrets_loads_local_dir_once(mocker, secret_importer):
+    import_from_dir = mocker.patch(
+        "ocdeployer.secrets.import_secrets_from_dir",
+        return_value={"secret1": {"data": {}}, "secret2": {"data": {}}},
+    )
+    import_from_local = mocker.patch("ocdeployer.secrets.import_secret_from_local_storage")
+
+    import_secrets({"secrets": ["secret1", "secret2", "secret3"]}, [])
+
+    import_from_dir.assert_called_once_with("secretsTEST")
+    assert import_from_local.call_count == 2
+    assert sorted(secret_importer.handled_secret_names) == ["secret1", "secret2"]
+
+
+def test_handle_skips_secrets_already_handled(mocker, secret_importer):
+    mocker.patch.object(SecretImporter, "local_dir", None)
+    get_secret = mocker.patch.object(SecretImporter, "_get_secret", return_value="secret1")
+    oc = mocker.patch("ocdeployer.secrets.oc")
+
+    SecretImporter.handle("secret1", link=["default"])
+    SecretImporter.handle("secret1", link=["default", "builder"])
+
+    get_secret.assert_called_once_with("secret1")
+    assert oc.call_args_list == [
+        mocker.call("secrets", "link", "default", "secret1", "--for=pull,mount"),
+        mocker.call("secrets", "link", "builder", "secret1", "--for=pull,mount"),
+    ]
+
+
+def test_import_secrets_links_after_imports(mocker, secret_importer):
+    mocker.patch.object(SecretImporter, "local_dir", None)
+    calls = []
+    mocker.patch.object(
+        SecretImporter, "_get_secret", side_effect=lambda name: calls.append(("get", name)) or name
+    )
+    mocker.patch(
+        "ocdeployer.secrets.oc", side_effect=lambda *args: calls.append(("link", args[3]))
+    )
+
+    import_secrets(
+        {
+            "secrets": [
+                {"name": "secret1", "link": ["default"]},
+                {"name": "secret2", "link": ["default"]},
+            ]
+        },
+        [],
+    )
+
+    assert sorted(calls[:2]) == [("get", "secret1"), ("get", "secret2")]
+    assert calls[2:] == [("link", "secret1"), ("link", "secret2")]
@@ -1,6 +1,7 @@
+import os
 import pytest
 
-from ocdeployer.templates import Template
+from ocdeployer.templates import Template, clear_cached_templates, get_cached_templates_in_dir
 
 
 @pytest.mark.parametrize(
@@ -17,3 +18,23 @@ from ocdeployer.templates import Template
 )
 def test_template_oc_param_format(value, expected):
     assert Template._format_oc_parameter(value) == expected
+
+
+def test_get_cached_templates_in_dir(tmp_path):
+    (tmp_path / "comp1.yml").write_text("{}")
+    first = get_cached_templates_in_dir(str(tmp_path))
+    assert list(first) == ["comp1"]
+    assert get_cached_templates_in_dir(str(tmp_path)) is first
+
+    old_mtime_ns = os.stat(str(tmp_path)).st_mtime_ns
+    (tmp_path / "comp2.yml").write_text("{}")
+    # Don't rely on the filesystem's mtime resolution to notice the new file
+    os.utime(str(tmp_path), ns=(old_mtime_ns + 1, old_mtime_ns + 1))
+    assert sorted(get_cached_templates_in_dir(str(tmp_path))) == ["comp1", "comp2"]
+
+
+def test_clear_cached_templates(tmp_path):
+    (tmp_path / "comp1.yml").write_text("{}")
+    first = get_cached_templates_in_dir(str(tmp_path))
+    clear_cached_templates()
+    assert get_cached_templates_in_dir(str(tmp_path)) is not first
@@ -1,3 +1,5 @@
+import threading
+
 import ocdeployer.utils as utils
 
 
@@ -35,3 +37,228 @@ def test_object_merge_recursively_merges_dicts():
     utils.object_merge(add, edit)
 
     assert edit == {"things": {"stuff": 1, "new": 2}}
+
+
+def test_load_cfg_file_parses_once(tmp_path, mocker):
+    path = tmp_path / "cfg.yml"
+    path.write_text("key: value\n")
+    parse = mocker.spy(utils, "_parse_cfg_file")
+
+    first = utils.load_cfg_file(str(path))
+    first["key"] = "changed"
+    second = utils.load_cfg_file(str(path))
+
+    assert second == {"key": "value"}
+    assert parse.call_count == 1
+
+
+def test_load_cfg_file_reloads_modified_file(tmp_path):
+    path = tmp_path / "cfg.yml"
+    path.write_text("key: value\n")
+    assert utils.load_cfg_file(str(path)) == {"key": "value"}
+
+    path.write_text("key: new value\n")
+    assert utils.load_cfg_file(str(path)) == {"key": "new value"}
+
+
+def test_all_sets(tmp_path):
+    (tmp_path / "_cfg.yml").write_text(
+        "deploy_order:\n"
+        "  stage0:\n    components: [set1, set2]\n"
+        "  stage1:\n    components: [set3]\n"
+    )
+
+    assert utils.all_sets(str(tmp_path)) == ["set1", "set2", "set3"]
+
+
+def _route(name, host):
+    return {"metadata": {"name": name}, "spec": {"host": host}}
+
+
+def test_get_routes(mocker):
+    get_json = mocker.patch(
+        "ocdeployer.utils.get_json", return_value={"items": [_route("svc", "svc.example.com")]}
+    )
+
+    assert utils.get_routes(namespace="myproject") == {"svc": "svc.example.com"}
+    get_json.assert_called_once_with("route", namespace="myproject")
+
+
+def test_get_server_info_cached(mocker):
+    utils.get_server_info.cache_clear()
+    oc = mocker.patch("ocdeployer.utils.oc", return_value="https://api.example.com:6443")
+
+    assert utils.get_server_info() == "https://api.example.com:6443"
+    assert utils.get_server_info() == "https://api.example.com:6443"
+    assert oc.call_count == 1
+    utils.get_server_info.cache_clear()
+
+
+def test_oc_serializes_structured_input(mocker):
+    sh = mocker.patch("ocdeployer.utils.sh")
+
+    utils.oc("apply", "-f", "-", _in={"kind": "List", "items": []}, _silent=True)
+
+    assert sh.oc.call_args[1]["_in"] == '{"kind":"List","items":[]}'
+
+
+def test_get_cfg_files_in_dir(tmp_path):
+    for name in ("b.json", "a.yml", "c.yaml", "_cfg.yaml", ".hidden.yaml", "notes.txt"):
+        (tmp_path / name).write_text("{}")
+
+    files = utils.get_cfg_files_in_dir(str(tmp_path))
+
+    assert files == [str(tmp_path / name) for name in ("c.yaml", "a.yml", "b.json")]
+    assert utils.get_cfg_files_in_dir(str(tmp_path / "missing")) == []
+
+
+def test_fast_clone():
+    data = {"a": [1, {"b": "c"}], "d": None, "e": {1, 2}}
+
+    clone = utils.fast_clone(data)
+
+    assert clone == data
+    assert clone["a"] is not data["a"]
+    assert clone["a"][1] is not data["a"][1]
+    assert clone["e"] is not data["e"]
+
+
+def test_apply_templates_single_call(mocker):
+    mock_oc = mocker.patch("ocdeployer.utils.oc")
+    templates = [
+        mocker.Mock(processed_content={"kind": "List", "items": [{"kind": "Service"}]}),
+        mocker.Mock(processed_content={"kind": "List", "items": [{"kind": "Route"}]}),
+    ]
+
+    utils.apply_templates("test-project", templates)
+
+    assert mock_oc.call_count == 1
+    assert mock_oc.call_args[1]["_in"]["items"] == [{"kind": "Service"}, {"kind": "Route"}]
+
+
+def test_trigger_builds(mocker):
+    mocker.patch("ocdeployer.utils.get_build_tree", return_value=[["parent", "child"], ["other"]])
+    cancel_builds = mocker.patch("ocdeployer.utils.cancel_builds")
+    mocker.patch("ocdeployer.utils.get_next_build", side_effect=lambda bc_name: f"{bc_name}-2")
+    mock_oc = mocker.patch("ocdeployer.utils.oc")
+
+    builds = utils.trigger_builds([])
+
+    assert builds == [("build", "parent-2"), ("build", "child-2"), ("build", "other-2")]
+    cancel_builds.assert_called_once_with("parent", "child", "other")
+    mock_oc.assert_has_calls(
+        [mocker.call("start-build", "bc/parent"), mocker.call("start-build", "bc/other")]
+    )
+
+
+def test_cancel_builds(mocker):
+    mocker.patch(
+        "ocdeployer.utils.get_json",
+        return_value={
+            "items": [
+                {
+                    "metadata": {
+                        "name": "bc2-3",
+                        "labels": {"openshift.io/build-config.name": "bc2"},
+                    },
+                    "status": {"phase": "Pending"},
+                },
+                {"metadata": {"name": "bc1-1"}, "status": {"phase": "Complete"}},
+            ]
+        },
+    )
+    mock_oc = mocker.patch("ocdeployer.utils.oc")
+
+    utils.cancel_builds("bc1", "bc2")
+
+    utils.get_json.assert_called_once_with(
+        "build", label="openshift.io/build-config.name in (bc1,bc2)"
+    )
+    assert mock_oc.call_args_list == [
+        mocker.call(
+            "cancel-build",
+            "bc/bc1",
+            "bc/bc2",
+            state="new,pending,running",
+            _timeout=120,
+            _exit_on_err=False,
+        ),
+        mocker.call("delete", "build", "bc2-3"),
+    ]
+
+
+def test_merge_layers_matches_object_merge():
+    def layers():
+        return (
+            {"a": 1, "l": [1], "d": {"x": 1, "l": ["g"]}, "g": {"only": "global"}},
+            {"a": 2, "l": [2], "d": {"y": 2, "l": ["s"]}, "s": "set"},
+            {"l": [3], "d": {"x": 3}, "c": None, "parameters": {}},
+        )
+
+    global_vars, set_vars, comp_vars = layers()
+    expected = utils.object_merge(*layers()[:1], utils.object_merge(*layers()[1:]))
+
+    merged = utils.merge_layers(global_vars, set_vars, comp_vars)
+
+    assert merged == expected
+    assert list(merged) == list(expected)
+    assert (global_vars, set_vars, comp_vars) == layers()
+    assert merged["g"] is not global_vars["g"]
+
+
+def test_get_names(mocker):
+    oc = mocker.patch("ocdeployer.utils.oc", return_value="image1:tag image2:latest\n")
+    assert utils.get_names("istag", namespace="myproject") == {"image1:tag", "image2:latest"}
+    oc.assert_called_once_with(
+        "get",
+        "imagestreamtag",
+        "-o",
+        "jsonpath={.items[*].metadata.name}",
+        "-n",
+        "myproject",
+        _exit_on_err=False,
+        _silent=True,
+    )
+
+
+def test_get_names_failed_lookup(mocker):
+    mocker.patch("ocdeployer.utils.oc", return_value=None)
+    assert utils.get_names("istag") == set()
+
+
+def test_run_in_threadpool(mocker):
+    mocker.patch.object(utils, "_threadpool_size", 2)
+    caller = threading.current_thread()
+    original_name = caller.name
+    caller.name = "service-set"
+
+    def _work(item):
+        return item * 2, threading.current_thread().name
+
+    try:
+        results = utils.run_in_threadpool(_work, [1, 2, 3])
+    finally:
+        caller.name = original_name
+
+    assert results == [(2, "service-set"), (4, "service-set"), (6, "service-set")]
+    assert utils.run_in_threadpool(_work, []) == []
+
+
+def test_run_in_threadpool_respects_size(mocker):
+    mocker.patch.object(utils, "_threadpool_size", 4)
+    mocker.patch.object(utils, "_threadpool_semaphore", threading.BoundedSemaphore(2))
+    lock = threading.Lock()
+    running = []
+    max_running = []
+
+    def _work(item):
+        with lock:
+            running.append(item)
+            max_running.append(len(running))
+        utils.time.sleep(0.01)
+        with lock:
+            running.remove(item)
+
+    utils.run_in_threadpool(_work, range(8))
+
+    assert max(max_running) <= 2